@@ -4,3 +4,4 @@ from django.apps import AppConfig as DjangoAppConfig
 class AppConfig(DjangoAppConfig):
     name = "intecomm_eligibility"
     verbose_name = "Intecomm Eligibility"
+    default_auto_field = "django.db.models.BigAutoField"
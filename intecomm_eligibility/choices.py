@@ -0,0 +1,6 @@
+from .constants import HASH, RANGE
+
+SHARD_STRATEGIES = (
+    (RANGE, "Primary key range"),
+    (HASH, "Primary key hash"),
+)
@@ -0,0 +1,2 @@
+HASH = "hash"
+RANGE = "range"
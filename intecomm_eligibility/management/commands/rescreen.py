@@ -0,0 +1,128 @@
+from argparse import ArgumentTypeError
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import color_style
+
+from intecomm_eligibility.constants import HASH, RANGE
+from intecomm_eligibility.rescreen import RescreenError, ShardedRescreen
+
+style = color_style()
+
+
+def positive_int(value: str) -> int:
+    try:
+        value = int(value)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise ArgumentTypeError("expected a positive integer")
+    return value
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-screen all subject screening instances in shards. Run on as many "
+        "hosts (or local processes) as needed with the same run name. An "
+        "interrupted run resumes from its last checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("run_name", type=str, help="name shared by all workers of a run")
+        parser.add_argument(
+            "--shards", type=positive_int, default=None, help="number of shards (default: 4)"
+        )
+        parser.add_argument(
+            "--strategy",
+            choices=[RANGE, HASH],
+            default=None,
+            help=(
+                "split the table by primary key range or by primary key modulo the "
+                "number of shards; hash needs an integer primary key, otherwise range "
+                "is used (default: range)"
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=positive_int,
+            default=None,
+            help="records per batch; a checkpoint is saved after each batch",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=positive_int,
+            default=None,
+            help="seconds without a checkpoint before a claimed shard may be taken over",
+        )
+        parser.add_argument(
+            "--model",
+            type=str,
+            default=None,
+            help="screening model in label_lower format (default: SUBJECT_SCREENING_MODEL)",
+        )
+        parser.add_argument(
+            "--status",
+            action="store_true",
+            default=False,
+            help="show per-shard progress and exit",
+        )
+
+    def handle(self, *args, **options):
+        if not options["model"] and not getattr(settings, "SUBJECT_SCREENING_MODEL", None):
+            raise CommandError(
+                "Unknown screening model. Set settings.SUBJECT_SCREENING_MODEL "
+                "or use --model."
+            )
+        try:
+            rescreen = ShardedRescreen(
+                options["run_name"],
+                model_cls=(
+                    django_apps.get_model(options["model"]) if options["model"] else None
+                ),
+                shard_count=options["shards"],
+                strategy=options["strategy"],
+                batch_size=options["batch_size"],
+                stale_after=options["stale_after"],
+                progress_func=self.write_progress,
+            )
+            if options["strategy"] and options["strategy"] != rescreen.strategy:
+                self.stdout.write(
+                    style.WARNING(
+                        f"Primary key is not an integer. Using {rescreen.strategy} "
+                        f"instead of {options['strategy']}."
+                    )
+                )
+            if options["status"]:
+                shards = list(rescreen.shards)
+            else:
+                self.stdout.write(f"Re-screening as worker {rescreen.worker} ...")
+                processed = rescreen.run()
+                self.stdout.write(style.SUCCESS(f"Done. Re-screened {processed} records."))
+                shards = rescreen.create_shards()
+        except (LookupError, RescreenError) as e:
+            raise CommandError(e)
+        for shard in shards:
+            self.write_status(shard)
+
+    def write_progress(self, shard) -> None:
+        self.stdout.write(
+            f"  shard {shard.shard + 1}/{shard.shard_count}: {shard.processed} processed, "
+            f"{shard.errors} errors, {shard.throughput:.1f} records/s"
+        )
+
+    def write_status(self, shard) -> None:
+        if shard.done_datetime:
+            state = style.SUCCESS("done")
+        elif shard.claimed_by:
+            state = (
+                f"claimed by {shard.claimed_by}, last checkpoint {shard.heartbeat_datetime}"
+            )
+        else:
+            state = style.WARNING("pending")
+        self.stdout.write(
+            f"{shard}: {shard.processed} processed, {shard.errors} errors, "
+            f"{shard.throughput:.1f} records/s, {state}"
+        )
+        if shard.failed:
+            self.stdout.write(style.ERROR(f"  failed pks: {', '.join(shard.failed)}"))
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RescreenShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_name', models.CharField(max_length=50)),
+                ('model_name', models.CharField(max_length=100)),
+                ('shard', models.PositiveIntegerField()),
+                ('shard_count', models.PositiveIntegerField()),
+                ('strategy', models.CharField(choices=[('range', 'Primary key range'), ('hash', 'Primary key hash')], default='range', max_length=10)),
+                ('lower_pk', models.CharField(help_text='inclusive', max_length=50, null=True)),
+                ('upper_pk', models.CharField(help_text='exclusive', max_length=50, null=True)),
+                ('last_pk', models.CharField(max_length=50, null=True)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('elapsed', models.FloatField(default=0.0, help_text='seconds spent processing')),
+                ('claimed_by', models.CharField(max_length=100, null=True)),
+                ('heartbeat_datetime', models.DateTimeField(null=True)),
+                ('started_datetime', models.DateTimeField(null=True)),
+                ('done_datetime', models.DateTimeField(null=True)),
+            ],
+            options={
+                'verbose_name': 'Re-screen shard',
+                'verbose_name_plural': 'Re-screen shards',
+                'ordering': ('run_name', 'shard'),
+                'unique_together': {('run_name', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intecomm_eligibility', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rescreenshard',
+            name='errors',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rescreenshard',
+            name='failed_pks',
+            field=models.TextField(help_text='one pk per line', null=True),
+        ),
+    ]
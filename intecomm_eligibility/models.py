@@ -0,0 +1,64 @@
+from django.db import models
+
+from .choices import SHARD_STRATEGIES
+from .constants import RANGE
+
+
+class RescreenShard(models.Model):
+    """A shard of a bulk re-screen run.
+
+    Doubles as the lock table: a worker owns a shard while
+    `claimed_by` is its name and its heartbeat is fresh. `last_pk`
+    is the checkpoint an interrupted shard resumes from.
+    """
+
+    run_name = models.CharField(max_length=50)
+
+    model_name = models.CharField(max_length=100)
+
+    shard = models.PositiveIntegerField()
+
+    shard_count = models.PositiveIntegerField()
+
+    strategy = models.CharField(max_length=10, choices=SHARD_STRATEGIES, default=RANGE)
+
+    lower_pk = models.CharField(max_length=50, null=True, help_text="inclusive")
+
+    upper_pk = models.CharField(max_length=50, null=True, help_text="exclusive")
+
+    last_pk = models.CharField(max_length=50, null=True)
+
+    processed = models.PositiveIntegerField(default=0)
+
+    errors = models.PositiveIntegerField(default=0)
+
+    failed_pks = models.TextField(null=True, help_text="one pk per line")
+
+    elapsed = models.FloatField(default=0.0, help_text="seconds spent processing")
+
+    claimed_by = models.CharField(max_length=100, null=True)
+
+    heartbeat_datetime = models.DateTimeField(null=True)
+
+    started_datetime = models.DateTimeField(null=True)
+
+    done_datetime = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.run_name} {self.shard + 1}/{self.shard_count}"
+
+    @property
+    def failed(self) -> list[str]:
+        """Returns the pks of records that raised when re-screened."""
+        return self.failed_pks.split("\n") if self.failed_pks else []
+
+    @property
+    def throughput(self) -> float:
+        """Returns records processed per second."""
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    class Meta:
+        verbose_name = "Re-screen shard"
+        verbose_name_plural = "Re-screen shards"
+        unique_together = ("run_name", "shard")
+        ordering = ("run_name", "shard")
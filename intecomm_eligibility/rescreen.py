@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import time
+from collections.abc import Callable
+from datetime import timedelta
+from typing import Any
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce, Mod
+from django.utils import timezone
+from edc_screening.utils import get_subject_screening_model_cls
+
+from .constants import HASH, RANGE
+from .models import RescreenShard
+
+logger = logging.getLogger(__name__)
+
+
+class RescreenError(Exception):
+    pass
+
+
+class ShardClaimLost(Exception):
+    pass
+
+
+def rescreen_subject(obj) -> None:
+    """Re-assesses and saves the eligibility of a screening instance.
+
+    The screening model's save() runs its `eligibility_cls` and sets
+    the eligibility datetimes.
+    """
+    obj.save(
+        update_fields=[
+            "eligible",
+            "reasons_ineligible",
+            "eligibility_datetime",
+            "real_eligibility_datetime",
+        ]
+    )
+
+
+def get_worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class ShardedRescreen:
+    """Re-screens a screening table in shards claimed through
+    `RescreenShard`.
+
+    Any number of workers, on one or more hosts, may call `run()` for
+    the same `run_name`. Each claims a free or stale shard, processes
+    it in batches of `batch_size` and checkpoints after every batch.
+    A batch and its checkpoint are committed together so an
+    interrupted shard resumes after the last committed batch. A record
+    that raises is rolled back, counted in `errors`, added to
+    `failed_pks` and skipped.
+
+    Workers joining an existing run take `shard_count` and `strategy`
+    from it unless given explicitly.
+
+    Shards are pk ranges or, for integer pks, pk modulo `shard_count`
+    filtered in the database. A hash split of a non-integer pk would
+    need every shard to scan the whole table, so range is used instead.
+    """
+
+    batch_size: int = 500
+    shard_count: int = 4
+    stale_after: int = 300  # seconds without a heartbeat
+    strategy: str = RANGE
+
+    def __init__(
+        self,
+        run_name: str,
+        model_cls: Any = None,
+        shard_count: int | None = None,
+        strategy: str | None = None,
+        batch_size: int | None = None,
+        stale_after: int | None = None,
+        worker: str | None = None,
+        rescreen_func: Callable[[Any], None] | None = None,
+        progress_func: Callable[[RescreenShard], None] | None = None,
+    ):
+        for name, value in [
+            ("shard_count", shard_count),
+            ("batch_size", batch_size),
+            ("stale_after", stale_after),
+        ]:
+            if value is not None and value < 1:
+                raise RescreenError(
+                    f"Invalid {name}. Expected a positive integer. Got {value}."
+                )
+        self.run_name = run_name
+        self.model_cls = model_cls or get_subject_screening_model_cls()
+        self.shard_count_given = shard_count is not None
+        self.strategy_given = strategy is not None
+        self.shard_count = shard_count or self.shard_count
+        self.strategy = strategy or self.strategy
+        self.batch_size = batch_size or self.batch_size
+        self.stale_after = stale_after or self.stale_after
+        self.worker = worker or get_worker_name()
+        self.rescreen_func = rescreen_func or rescreen_subject
+        self.progress_func = progress_func
+        if self.strategy not in [RANGE, HASH]:
+            raise RescreenError(f"Invalid strategy. Expected one of {[RANGE, HASH]}.")
+        if self.strategy == HASH and not isinstance(
+            self.model_cls._meta.pk, models.IntegerField
+        ):
+            self.strategy = RANGE  # hash is pk modulo shard_count, integer pks only
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(run_name={self.run_name})"
+
+    @property
+    def shards(self):
+        return RescreenShard.objects.filter(run_name=self.run_name)
+
+    def create_shards(self) -> list[RescreenShard]:
+        """Returns the shards of this run, creating them on first use.
+
+        The first worker to create a run fixes its plan. Later workers
+        take it over, or must agree with it where given explicitly.
+        """
+        if not self.shards.exists():
+            bounds = self.get_range_bounds() if self.strategy == RANGE else None
+            try:
+                with transaction.atomic():
+                    RescreenShard.objects.bulk_create(
+                        [
+                            RescreenShard(
+                                run_name=self.run_name,
+                                model_name=self.model_cls._meta.label_lower,
+                                shard=index,
+                                shard_count=self.shard_count,
+                                strategy=self.strategy,
+                                lower_pk=bounds[index] if bounds else None,
+                                upper_pk=bounds[index + 1] if bounds else None,
+                            )
+                            for index in range(self.shard_count)
+                        ]
+                    )
+            except IntegrityError:
+                pass  # another worker created the run first
+        shards = list(self.shards)
+        if not self.shard_count_given:
+            self.shard_count = shards[0].shard_count
+        if not self.strategy_given:
+            self.strategy = shards[0].strategy
+        for shard in shards:
+            if (
+                shard.model_name != self.model_cls._meta.label_lower
+                or shard.shard_count != self.shard_count
+                or shard.strategy != self.strategy
+            ):
+                raise RescreenError(
+                    f"Run `{self.run_name}` already exists with a different plan. "
+                    f"Got {shard.model_name}, {shard.shard_count} shards by "
+                    f"{shard.strategy}."
+                )
+        return shards
+
+    def get_range_bounds(self) -> list[str | None]:
+        """Returns `shard_count + 1` pk bounds splitting the table into
+        ranges of about equal size.
+        """
+        pks = self.model_cls.objects.order_by("pk").values_list("pk", flat=True)
+        total = pks.count()
+        if not total:
+            raise RescreenError(
+                f"Nothing to rescreen. See {self.model_cls._meta.label_lower}."
+            )
+        bounds = [None]
+        for index in range(1, self.shard_count):
+            bounds.append(str(pks[index * total // self.shard_count]))
+        bounds.append(None)
+        return bounds
+
+    def claim_shard(self) -> RescreenShard | None:
+        """Returns a shard claimed for this worker or None.
+
+        A shard is free if unclaimed, already claimed by this worker or
+        its claim is stale. Claims are made by compare-and-set on the
+        claim columns, so two workers cannot take the same shard.
+        """
+        stale_datetime = timezone.now() - timedelta(seconds=self.stale_after)
+        candidates = self.shards.filter(done_datetime__isnull=True).filter(
+            Q(claimed_by__isnull=True)
+            | Q(claimed_by=self.worker)
+            | Q(heartbeat_datetime__lt=stale_datetime)
+        )
+        for shard in candidates:
+            now = timezone.now()
+            claimed = RescreenShard.objects.filter(
+                pk=shard.pk,
+                claimed_by=shard.claimed_by,
+                heartbeat_datetime=shard.heartbeat_datetime,
+            ).update(
+                claimed_by=self.worker,
+                heartbeat_datetime=now,
+                started_datetime=Coalesce(F("started_datetime"), Value(now)),
+            )
+            if claimed:
+                shard.refresh_from_db()
+                return shard
+        return None
+
+    def release_shard(self, shard: RescreenShard) -> None:
+        RescreenShard.objects.filter(pk=shard.pk, claimed_by=self.worker).update(
+            claimed_by=None, heartbeat_datetime=None
+        )
+
+    def run(self) -> int:
+        """Processes shards until none are left to claim and returns
+        the number of records re-screened by this worker.
+        """
+        self.create_shards()
+        processed = 0
+        while shard := self.claim_shard():
+            try:
+                processed += self.process_shard(shard)
+            except ShardClaimLost:
+                pass
+            except BaseException:
+                self.release_shard(shard)
+                raise
+        return processed
+
+    def process_shard(self, shard: RescreenShard) -> int:
+        processed = 0
+        last_pk = self.to_pk(shard.last_pk)
+        while pks := self.get_next_pks(shard, last_pk):
+            start = time.monotonic()
+            with transaction.atomic():
+                objs = self.model_cls.objects.in_bulk(pks)
+                failed = [pk for pk, obj in objs.items() if not self.rescreen_obj(obj)]
+                last_pk = pks[-1]
+                self.checkpoint(
+                    shard, last_pk, len(objs) - len(failed), time.monotonic() - start, failed
+                )
+            processed += len(objs) - len(failed)
+            if self.progress_func:
+                self.progress_func(shard)
+        RescreenShard.objects.filter(pk=shard.pk, claimed_by=self.worker).update(
+            done_datetime=timezone.now()
+        )
+        return processed
+
+    def rescreen_obj(self, obj) -> bool:
+        """Returns True if the record was re-screened, otherwise rolls
+        back its changes, logs the error and returns False.
+        """
+        try:
+            with transaction.atomic():
+                self.rescreen_func(obj)
+        except Exception:
+            logger.exception(f"Unable to re-screen {obj._meta.label_lower} pk={obj.pk}.")
+            return False
+        return True
+
+    def get_next_pks(self, shard: RescreenShard, last_pk: Any) -> list:
+        qs = self.model_cls.objects.order_by("pk")
+        if shard.lower_pk is not None:
+            qs = qs.filter(pk__gte=self.to_pk(shard.lower_pk))
+        if shard.upper_pk is not None:
+            qs = qs.filter(pk__lt=self.to_pk(shard.upper_pk))
+        if shard.strategy == HASH:
+            qs = qs.annotate(shard_index=Mod("pk", shard.shard_count)).filter(
+                shard_index=shard.shard
+            )
+        if last_pk is not None:
+            qs = qs.filter(pk__gt=last_pk)
+        return list(qs.values_list("pk", flat=True)[: self.batch_size])
+
+    def checkpoint(
+        self,
+        shard: RescreenShard,
+        last_pk: Any,
+        count: int,
+        elapsed: float,
+        failed: list | None = None,
+    ):
+        """Saves progress for the shard or raises if another worker
+        has taken it over.
+        """
+        failed_pks = "\n".join([*shard.failed, *[str(pk) for pk in failed or []]]) or None
+        updated = RescreenShard.objects.filter(pk=shard.pk, claimed_by=self.worker).update(
+            last_pk=str(last_pk),
+            processed=F("processed") + count,
+            errors=F("errors") + len(failed or []),
+            failed_pks=failed_pks,
+            elapsed=F("elapsed") + elapsed,
+            heartbeat_datetime=timezone.now(),
+        )
+        if not updated:
+            raise ShardClaimLost(f"Shard claimed by another worker. Got {shard}.")
+        shard.last_pk = str(last_pk)
+        shard.processed += count
+        shard.errors += len(failed or [])
+        shard.failed_pks = failed_pks
+        shard.elapsed += elapsed
+
+    def to_pk(self, value: str | None) -> Any:
+        return None if value is None else self.model_cls._meta.pk.to_python(value)
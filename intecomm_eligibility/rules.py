@@ -0,0 +1,400 @@
+"""Declarative eligibility rules compiled into an evaluator.
+
+A rules file (JSON, or YAML if PyYAML is installed) has four sections:
+
+* ``fields``: {field_name: constraint or null}. A constraint is one of
+  ``{"eq": str}``, ``{"in": [...]}`` or ``{"range": [min, max]}``
+  (inclusive, integer bounds only) with a ``msg`` and, optionally,
+  ``ignore_if_missing`` and ``missing_value``. These behave exactly
+  like `FC` objects returned by `get_required_fields`.
+* ``expressions``: {name: expression}. Named sub-expressions, referred
+  to with ``{"ref": name}`` and evaluated at most once per record.
+* ``conditions``: {condition: expression name}. The qualifying
+  conditions.
+* ``rules``: a list of ``{"reason", "msg", "when", "unless"}``. A rule
+  adds `reason` to `reasons_ineligible` if `when` is true and none of
+  the rules named in `unless` were added. Each `reason` may be used
+  by one rule only.
+
+An expression is ``{"all": [...]}``, ``{"any": [...]}``, ``{"not": expr}``
+(with no other keys) or an operand -- ``{"field": name}``, ``{"ref": name}`` or
+``{"mean": [field, ...]}`` -- with at most one operator: ``eq``, ``ne``,
+``in``, ``not_in``, ``gt``, ``gte``, ``lt``, ``lte`` or ``missing``
+(true if the value is falsy). Without an operator the operand's value
+is used as is, e.g. tested for truthiness by ``all`` or ``when``.
+The mean is None unless all fields have a value.
+"""
+
+from __future__ import annotations
+
+import json
+import operator
+from collections import Counter
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from django.conf import settings
+from edc_constants.constants import NO, TBD, YES
+from edc_screening.fc import FC
+
+__all__ = [
+    "EligibilityResult",
+    "RuleSet",
+    "RuleSetError",
+    "get_rules_path",
+    "load_ruleset",
+]
+
+LOGICAL_OPS = ["all", "any", "not"]
+OPERANDS = ["field", "ref", "mean"]
+OPERATORS: dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "in": lambda value, arg: value in arg,
+    "not_in": lambda value, arg: value not in arg,
+    "gt": lambda value, arg: value is not None and value > arg,
+    "gte": lambda value, arg: value is not None and value >= arg,
+    "lt": lambda value, arg: value is not None and value < arg,
+    "lte": lambda value, arg: value is not None and value <= arg,
+    "missing": lambda value, arg: (not value) == arg,
+}
+
+_UNSET = object()
+
+
+class RuleSetError(Exception):
+    pass
+
+
+@dataclass
+class EligibilityResult:
+    eligible: str
+    reasons_ineligible: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def is_eligible(self) -> bool:
+        return self.eligible == YES
+
+
+@dataclass
+class Constraint:
+    fldattr: str
+    check: Callable[[Any], bool]
+    fc: FC
+
+    @property
+    def msg(self) -> str:
+        return self.fc.msg or self.fldattr.title().replace("_", " ")
+
+    def is_missing(self, value: Any) -> bool:
+        if self.fc.ignore_if_missing:
+            return False
+        return not value or bool(self.fc.missing_value and value == self.fc.missing_value)
+
+
+@dataclass
+class Rule:
+    reason: str
+    msg: str
+    when: Callable
+    unless: list[str]
+
+
+class Compiler:
+    """Compiles the expressions and rules of a rules file into
+    closures of the form `func(values, cache)`.
+
+    Identical sub-expressions share one closure. Those used more than
+    once, and all named expressions, get a slot in the per-record
+    cache.
+    """
+
+    def __init__(self, field_names: Iterable[str], expressions: dict, roots: list):
+        self.field_names = set(field_names)
+        self.expressions = expressions
+        self.compiled: dict[str, Callable] = {}
+        self.compiling: list[str] = []
+        self.slots = 0
+        self.counts = Counter()
+        for node in [*expressions.values(), *roots]:
+            self.count(node)
+
+    @staticmethod
+    def key(node: Any) -> str:
+        return json.dumps(node, sort_keys=True)
+
+    def count(self, node: Any) -> None:
+        self.counts[self.key(node)] += 1
+        if isinstance(node, dict):
+            for op in LOGICAL_OPS:
+                if op in node:
+                    children = node[op] if op != "not" else [node[op]]
+                    for child in children if isinstance(children, list) else []:
+                        self.count(child)
+
+    def compile(self, node: Any) -> Callable:
+        key = self.key(node)
+        if key not in self.compiled:
+            func = self.compile_node(node)
+            if self.counts[key] > 1 and not node.keys() <= {"field", "ref"}:
+                func = self.cached(func)
+            self.compiled[key] = func
+        return self.compiled[key]
+
+    def cached(self, func: Callable) -> Callable:
+        slot = self.slots
+        self.slots += 1
+
+        def cached_func(values, cache):
+            value = cache[slot]
+            if value is _UNSET:
+                value = cache[slot] = func(values, cache)
+            return value
+
+        return cached_func
+
+    def compile_node(self, node: Any) -> Callable:
+        if not isinstance(node, dict):
+            raise RuleSetError(f"Invalid expression. Expected a mapping. Got {node}.")
+        if not any(op in node for op in LOGICAL_OPS):
+            return self.compile_comparison(node)
+        if len(node) != 1:
+            raise RuleSetError(
+                "Invalid expression. Expected exactly one of `all`, `any` or `not`. "
+                f"Got {node}."
+            )
+        [(op, arg)] = node.items()
+        if op == "not":
+            func = self.compile(arg)
+            return lambda values, cache: not func(values, cache)
+        if not isinstance(arg, list):
+            raise RuleSetError(f"Invalid expression. Expected a list for `{op}`. Got {node}.")
+        funcs = [self.compile(child) for child in arg]
+        if op == "all":
+            return lambda values, cache: all(func(values, cache) for func in funcs)
+        return lambda values, cache: any(func(values, cache) for func in funcs)
+
+    def compile_comparison(self, node: dict) -> Callable:
+        operands = [k for k in node if k in OPERANDS]
+        ops = [k for k in node if k in OPERATORS]
+        unknown = [k for k in node if k not in OPERANDS and k not in OPERATORS]
+        if len(operands) != 1 or len(ops) > 1 or unknown:
+            raise RuleSetError(
+                "Invalid expression. Expected one operand and at most one operator. "
+                f"Got {node}."
+            )
+        func = self.compile_operand(operands[0], node[operands[0]])
+        if not ops:
+            return func
+        op, arg = OPERATORS[ops[0]], node[ops[0]]
+        return lambda values, cache: op(func(values, cache), arg)
+
+    def compile_operand(self, operand: str, arg: Any) -> Callable:
+        if operand == "ref":
+            return self.compile_ref(arg)
+        names = arg if operand == "mean" else [arg]
+        for name in names:
+            if name not in self.field_names:
+                raise RuleSetError(f"Unknown field. Got `{name}`.")
+        if operand == "field":
+            return lambda values, cache: values.get(arg)
+
+        def mean(values, cache):
+            items = [values.get(name) for name in names]
+            return sum(items) / len(items) if all(items) else None
+
+        return mean
+
+    def compile_ref(self, name: str) -> Callable:
+        if name not in self.expressions:
+            raise RuleSetError(f"Unknown expression. Got `{name}`.")
+        if name in self.compiling:
+            raise RuleSetError(f"Circular expression. Got {' -> '.join(self.compiling)}.")
+        key = f"ref:{name}"
+        if key not in self.compiled:
+            self.compiling.append(name)
+            self.compiled[key] = self.cached(self.compile(self.expressions[name]))
+            self.compiling.pop()
+        return self.compiled[key]
+
+
+class RuleSet:
+    """An eligibility evaluator compiled from a rules file.
+
+    `evaluate` and `evaluate_many` give the same result as
+    `ScreeningEligibility` for a dict of field values.
+    """
+
+    def __init__(self, config: dict, name: str | None = None):
+        self.name = name
+        self.fields: dict[str, dict | None] = config.get("fields") or {}
+        self.constraints = [
+            self.get_constraint(fldattr, spec)
+            for fldattr, spec in self.fields.items()
+            if spec is not None
+        ]
+        rules = config.get("rules") or []
+        expressions = config.get("expressions") or {}
+        compiler = Compiler(self.fields, expressions, [rule.get("when") for rule in rules])
+        self.rules = [self.get_rule(compiler, rule) for rule in rules]
+        duplicates = [
+            reason
+            for reason, count in Counter(rule.reason for rule in self.rules).items()
+            if count > 1
+        ]
+        if duplicates:
+            raise RuleSetError(f"Duplicate rule `reason`. Got {duplicates}.")
+        self.rules_in_order = self.get_rules_in_order()
+        self.conditions = [
+            (condition, compiler.compile_ref(name))
+            for condition, name in (config.get("conditions") or {}).items()
+        ]
+        self.slots = compiler.slots
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.name})"
+
+    @staticmethod
+    def get_constraint(fldattr: str, spec: dict) -> Constraint:
+        opts = dict(
+            msg=spec.get("msg"),
+            ignore_if_missing=spec.get("ignore_if_missing", False),
+            missing_value=spec.get("missing_value"),
+        )
+        if isinstance(spec.get("eq"), str):
+            arg = spec["eq"]
+            return Constraint(fldattr, lambda value: value == arg, FC(arg, **opts))
+        if isinstance(spec.get("in"), list):
+            arg = spec["in"]
+            return Constraint(fldattr, lambda value: value in arg, FC(arg, **opts))
+        if isinstance(spec.get("range"), list) and len(spec["range"]) == 2:
+            lower, upper = spec["range"]
+            if not all(type(bound) is int for bound in [lower, upper]):
+                raise RuleSetError(
+                    f"Invalid field constraint. Expected integer `range` bounds. "
+                    f"See `{fldattr}`. Got {spec}."
+                )
+            return Constraint(
+                fldattr,
+                lambda value: lower <= value <= upper,
+                FC(range(lower, upper + 1), **opts),
+            )
+        raise RuleSetError(
+            f"Invalid field constraint. Expected one of `eq`, `in` or `range`. "
+            f"See `{fldattr}`. Got {spec}."
+        )
+
+    @staticmethod
+    def get_rule(compiler: Compiler, rule: dict) -> Rule:
+        try:
+            return Rule(
+                reason=rule["reason"],
+                msg=rule["msg"],
+                when=compiler.compile(rule["when"]),
+                unless=rule.get("unless") or [],
+            )
+        except KeyError as e:
+            raise RuleSetError(f"Invalid rule. Missing {e}. Got {rule}.")
+
+    def get_rules_in_order(self) -> list[Rule]:
+        """Returns the rules ordered so that each comes after the
+        rules named in its `unless`.
+        """
+        rules = {rule.reason: rule for rule in self.rules}
+        ordered: dict[str, Rule] = {}
+        visiting: list[str] = []
+
+        def visit(rule: Rule) -> None:
+            if rule.reason in ordered:
+                return
+            if rule.reason in visiting:
+                raise RuleSetError(f"Circular `unless`. Got {' -> '.join(visiting)}.")
+            visiting.append(rule.reason)
+            for reason in rule.unless:
+                if reason not in rules:
+                    raise RuleSetError(f"Unknown rule in `unless`. Got `{reason}`.")
+                visit(rules[reason])
+            visiting.pop()
+            ordered[rule.reason] = rule
+
+        for rule in self.rules:
+            visit(rule)
+        return list(ordered.values())
+
+    def get_required_fields(self) -> dict[str, FC | None]:
+        constraints = {constraint.fldattr: constraint.fc for constraint in self.constraints}
+        return {fldattr: constraints.get(fldattr) for fldattr in self.fields}
+
+    def new_cache(self) -> list:
+        return [_UNSET] * self.slots
+
+    def assess(self, values: dict, cache: list | None = None) -> dict[str, str]:
+        """Returns the reasons ineligible given by the rules, in the
+        order the rules are listed.
+        """
+        cache = self.new_cache() if cache is None else cache
+        fired = set()
+        for rule in self.rules_in_order:
+            if not fired.intersection(rule.unless) and rule.when(values, cache):
+                fired.add(rule.reason)
+        return {rule.reason: rule.msg for rule in self.rules if rule.reason in fired}
+
+    def get_qualifying_conditions(self, values: dict, cache: list | None = None) -> list[str]:
+        cache = self.new_cache() if cache is None else cache
+        return [condition for condition, func in self.conditions if func(values, cache)]
+
+    def evaluate(self, values: dict) -> EligibilityResult:
+        result = EligibilityResult(eligible=YES)
+        missing = [c.fldattr for c in self.constraints if c.is_missing(values.get(c.fldattr))]
+        for fldattr in missing:
+            result.reasons_ineligible[fldattr] = (
+                f"`{fldattr.replace('_', ' ').title()}` not answered"
+            )
+            result.eligible = TBD
+        for constraint in self.constraints:
+            if constraint.fldattr not in missing and not constraint.check(
+                values.get(constraint.fldattr)
+            ):
+                result.reasons_ineligible[constraint.fldattr] = constraint.msg
+                result.eligible = NO
+        if result.eligible == YES:
+            if not self.fields:
+                result.eligible = TBD
+            reasons_ineligible = self.assess(values)
+            if reasons_ineligible:
+                result.eligible = NO
+                result.reasons_ineligible.update(reasons_ineligible)
+        return result
+
+    def evaluate_many(self, records: Iterable[dict]) -> list[EligibilityResult]:
+        """Returns a result for each record, in order."""
+        return [self.evaluate(values) for values in records]
+
+
+def get_rules_path() -> Path:
+    return Path(
+        getattr(
+            settings,
+            "INTECOMM_ELIGIBILITY_RULES",
+            Path(__file__).resolve().parent / "eligibility_rules.json",
+        )
+    )
+
+
+@lru_cache(maxsize=None)
+def load_ruleset(path: Path | str) -> RuleSet:
+    """Returns the compiled rule set for a JSON or YAML rules file."""
+    path = Path(path)
+    with path.open() as f:
+        if path.suffix in [".yaml", ".yml"]:
+            try:
+                import yaml
+            except ImportError:
+                raise RuleSetError(f"PyYAML is required to load rules. Got {path}.")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    return RuleSet(config, name=path.name)
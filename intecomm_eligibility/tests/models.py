@@ -0,0 +1,62 @@
+from uuid import uuid4
+
+from django.db import models
+from edc_screening.model_mixins import EligibilityModelMixin
+from edc_utils import get_utcnow
+
+from intecomm_eligibility.eligibility import ScreeningEligibility
+
+
+class ScreeningIdentifier:
+    @property
+    def identifier(self) -> str:
+        return uuid4().hex[:8].upper()
+
+
+class ScreeningModelMixin(EligibilityModelMixin, models.Model):
+    eligibility_cls = ScreeningEligibility
+    identifier_cls = ScreeningIdentifier
+
+    screening_identifier = models.CharField(max_length=50, null=True)
+    report_datetime = models.DateTimeField(default=get_utcnow)
+
+    age_in_years = models.IntegerField(null=True)
+    art_adherent = models.CharField(max_length=15, null=True)
+    art_stable = models.CharField(max_length=15, null=True)
+    art_unchanged_3m = models.CharField(max_length=15, null=True)
+    consent_ability = models.CharField(max_length=15, null=True)
+    dia_blood_pressure_avg = models.IntegerField(null=True)
+    dia_blood_pressure_one = models.IntegerField(null=True)
+    dia_blood_pressure_two = models.IntegerField(null=True)
+    dm_complications = models.CharField(max_length=15, null=True)
+    dm_dx = models.CharField(max_length=15, null=True)
+    dm_dx_6m = models.CharField(max_length=15, null=True)
+    excluded_by_bp_history = models.CharField(max_length=15, null=True)
+    excluded_by_gluc_history = models.CharField(max_length=15, null=True)
+    gender = models.CharField(max_length=15, null=True)
+    hiv_dx = models.CharField(max_length=15, null=True)
+    hiv_dx_6m = models.CharField(max_length=15, null=True)
+    htn_complications = models.CharField(max_length=15, null=True)
+    htn_dx = models.CharField(max_length=15, null=True)
+    htn_dx_6m = models.CharField(max_length=15, null=True)
+    in_care_6m = models.CharField(max_length=15, null=True)
+    lives_nearby = models.CharField(max_length=15, null=True)
+    pregnant = models.CharField(max_length=15, null=True)
+    requires_acute_care = models.CharField(max_length=15, null=True)
+    staying_nearby_6 = models.CharField(max_length=15, null=True)
+    sys_blood_pressure_avg = models.IntegerField(null=True)
+    sys_blood_pressure_one = models.IntegerField(null=True)
+    sys_blood_pressure_two = models.IntegerField(null=True)
+    unsuitable_for_study = models.CharField(max_length=15, null=True)
+    unsuitable_agreed = models.CharField(max_length=15, null=True)
+
+    class Meta:
+        abstract = True
+
+
+class SubjectScreening(ScreeningModelMixin):
+    pass
+
+
+class UuidSubjectScreening(ScreeningModelMixin):
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
@@ -0,0 +1,293 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from edc_constants.constants import MALE, NO, NOT_APPLICABLE, YES
+
+from intecomm_eligibility.constants import HASH, RANGE
+from intecomm_eligibility.models import RescreenShard
+from intecomm_eligibility.rescreen import RescreenError, ShardedRescreen
+
+from .models import SubjectScreening, UuidSubjectScreening
+
+
+class RescreenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create([User(username=f"user{i}") for i in range(50)])
+
+    def setUp(self):
+        self.rescreened = []
+
+    def rescreen_func(self, obj):
+        self.rescreened.append(obj.pk)
+
+    def get_rescreen(self, **kwargs) -> ShardedRescreen:
+        opts = dict(
+            model_cls=User,
+            shard_count=4,
+            batch_size=7,
+            worker="host1:1",
+            rescreen_func=self.rescreen_func,
+        )
+        opts.update(**kwargs)
+        return ShardedRescreen("run1", **opts)
+
+    def test_range_shards(self):
+        shards = self.get_rescreen(strategy=RANGE).create_shards()
+        self.assertEqual(len(shards), 4)
+        self.assertIsNone(shards[0].lower_pk)
+        self.assertIsNone(shards[3].upper_pk)
+        for shard, next_shard in zip(shards, shards[1:]):
+            self.assertEqual(shard.upper_pk, next_shard.lower_pk)
+
+    def test_rescreens_each_record_once(self):
+        for strategy in [RANGE, HASH]:
+            with self.subTest(strategy=strategy):
+                self.rescreened = []
+                RescreenShard.objects.all().delete()
+                processed = self.get_rescreen(strategy=strategy).run()
+                self.assertEqual(processed, 50)
+                self.assertEqual(
+                    sorted(self.rescreened), sorted(User.objects.values_list("pk", flat=True))
+                )
+                self.assertFalse(
+                    RescreenShard.objects.filter(done_datetime__isnull=True).exists()
+                )
+
+    def test_failed_record_is_skipped(self):
+        bad_pk = User.objects.order_by("pk")[10].pk
+
+        def failing_func(obj):
+            if obj.pk == bad_pk:
+                obj.username = "changed"
+                obj.save()
+                raise ValueError("bad record")
+            self.rescreened.append(obj.pk)
+
+        with self.assertLogs("intecomm_eligibility.rescreen", level="ERROR"):
+            processed = self.get_rescreen(rescreen_func=failing_func).run()
+        self.assertEqual(processed, 49)
+        self.assertEqual(len(self.rescreened), 49)
+        self.assertNotEqual(User.objects.get(pk=bad_pk).username, "changed")
+        shard = RescreenShard.objects.get(errors__gt=0)
+        self.assertEqual(shard.errors, 1)
+        self.assertEqual(shard.failed, [str(bad_pk)])
+        self.assertEqual(
+            sum(RescreenShard.objects.values_list("processed", flat=True)), processed
+        )
+        self.assertFalse(RescreenShard.objects.filter(done_datetime__isnull=True).exists())
+
+    def test_invalid_options_raise(self):
+        for opts in [
+            dict(shard_count=0),
+            dict(shard_count=-2),
+            dict(batch_size=0),
+            dict(batch_size=-1),
+            dict(stale_after=0),
+            dict(strategy="random"),
+        ]:
+            with self.subTest(opts=opts):
+                self.assertRaises(RescreenError, self.get_rescreen, **opts)
+
+    def test_workers_share_run(self):
+        rescreen1 = self.get_rescreen(worker="host1:1")
+        rescreen2 = self.get_rescreen(worker="host2:1")
+        rescreen1.create_shards()
+        shard1 = rescreen1.claim_shard()
+        shard2 = rescreen2.claim_shard()
+        self.assertNotEqual(shard1.pk, shard2.pk)
+        self.assertEqual(shard2.claimed_by, "host2:1")
+        rescreen2.process_shard(shard2)
+        self.assertEqual(rescreen1.run() + shard2.processed, 50)
+        self.assertEqual(len(self.rescreened), 50)
+
+    def test_stale_claim_is_taken_over(self):
+        rescreen1 = self.get_rescreen(worker="host1:1", shard_count=1)
+        rescreen2 = self.get_rescreen(worker="host2:1", shard_count=1)
+        rescreen1.create_shards()
+        rescreen1.claim_shard()
+        self.assertIsNone(rescreen2.claim_shard())
+
+        RescreenShard.objects.update(heartbeat_datetime=timezone.now() - timedelta(hours=1))
+        shard = rescreen2.claim_shard()
+        self.assertEqual(shard.claimed_by, "host2:1")
+
+    def test_resumes_from_checkpoint(self):
+        def interrupted_func(obj):
+            if len(self.rescreened) == 20:
+                raise KeyboardInterrupt
+            self.rescreened.append(obj.pk)
+
+        rescreen = self.get_rescreen(shard_count=1, rescreen_func=interrupted_func)
+        self.assertRaises(KeyboardInterrupt, rescreen.run)
+        shard = RescreenShard.objects.get(run_name="run1")
+        # two batches of 7 were checkpointed, the third was rolled back
+        self.assertEqual(shard.processed, 14)
+        self.assertIsNone(shard.claimed_by)
+        self.assertIsNone(shard.done_datetime)
+
+        self.rescreened = []
+        self.assertEqual(self.get_rescreen(shard_count=1).run(), 36)
+        shard.refresh_from_db()
+        self.assertEqual(shard.processed, 50)
+        self.assertIsNotNone(shard.done_datetime)
+        self.assertNotIn(User.objects.order_by("pk")[0].pk, self.rescreened)
+
+    def test_plan_mismatch_raises(self):
+        self.get_rescreen(shard_count=4).create_shards()
+        self.assertRaises(RescreenError, self.get_rescreen(shard_count=2).create_shards)
+        self.assertRaises(RescreenError, self.get_rescreen(strategy=HASH).create_shards)
+
+    def test_joining_worker_takes_plan(self):
+        self.get_rescreen(worker="host1:1", shard_count=8, strategy=HASH).create_shards()
+        rescreen = self.get_rescreen(worker="host2:1", shard_count=None, strategy=None)
+        self.assertEqual(len(rescreen.create_shards()), 8)
+        self.assertEqual(rescreen.shard_count, 8)
+        self.assertEqual(rescreen.strategy, HASH)
+        self.assertEqual(rescreen.run(), 50)
+
+
+class RescreenCommandTests(TestCase):
+    eligible_data = dict(
+        age_in_years=25,
+        consent_ability=YES,
+        excluded_by_bp_history=NO,
+        excluded_by_gluc_history=NO,
+        gender=MALE,
+        hiv_dx=NO,
+        dm_dx=NO,
+        htn_dx=YES,
+        htn_dx_6m=YES,
+        htn_complications=NO,
+        in_care_6m=YES,
+        lives_nearby=YES,
+        pregnant=NOT_APPLICABLE,
+        requires_acute_care=NO,
+        staying_nearby_6=YES,
+        unsuitable_for_study=NO,
+        unsuitable_agreed=NOT_APPLICABLE,
+        sys_blood_pressure_one=140,
+        sys_blood_pressure_two=140,
+        dia_blood_pressure_one=90,
+        dia_blood_pressure_two=90,
+    )
+
+    def setUp(self):
+        self.report_datetime = timezone.now() - timedelta(days=10)
+        self.create_screenings(SubjectScreening)
+
+    def create_screenings(self, model_cls) -> None:
+        # bulk_create skips save(), as if saved under older criteria
+        model_cls.objects.bulk_create(
+            [
+                model_cls(report_datetime=self.report_datetime, **self.eligible_data)
+                for _ in range(10)
+            ]
+            + [
+                model_cls(
+                    report_datetime=self.report_datetime,
+                    eligible=True,
+                    eligibility_datetime=self.report_datetime,
+                    real_eligibility_datetime=self.report_datetime,
+                    **dict(self.eligible_data, htn_complications=YES),
+                )
+                for _ in range(5)
+            ]
+        )
+
+    def assert_rescreened(self, model_cls) -> None:
+        for obj in model_cls.objects.filter(htn_complications=NO):
+            self.assertTrue(obj.eligible)
+            self.assertIsNone(obj.reasons_ineligible)
+            self.assertEqual(obj.eligibility_datetime, self.report_datetime)
+            self.assertIsNotNone(obj.real_eligibility_datetime)
+        for obj in model_cls.objects.filter(htn_complications=YES):
+            self.assertFalse(obj.eligible)
+            self.assertEqual(obj.reasons_ineligible, "HTN complication")
+            self.assertIsNone(obj.eligibility_datetime)
+            self.assertIsNone(obj.real_eligibility_datetime)
+
+    def rescreen(self, *args) -> str:
+        out = StringIO()
+        call_command("rescreen", "run1", *args, stdout=out)
+        return out.getvalue()
+
+    def test_rescreen_range(self):
+        out = self.rescreen(
+            "--model=tests.subjectscreening",
+            "--shards=3",
+            "--batch-size=4",
+            "--strategy=range",
+        )
+        self.assertIn("Re-screened 15 records", out)
+        self.assert_rescreened(SubjectScreening)
+        self.assertEqual(
+            set(RescreenShard.objects.values_list("strategy", flat=True)), {RANGE}
+        )
+
+    def test_rescreen_hash(self):
+        out = self.rescreen(
+            "--model=tests.subjectscreening", "--shards=3", "--batch-size=4", "--strategy=hash"
+        )
+        self.assertIn("Re-screened 15 records", out)
+        self.assert_rescreened(SubjectScreening)
+        self.assertEqual(set(RescreenShard.objects.values_list("strategy", flat=True)), {HASH})
+
+    def test_rescreen_non_integer_pk_uses_range(self):
+        self.create_screenings(UuidSubjectScreening)
+        out = self.rescreen(
+            "--model=tests.uuidsubjectscreening",
+            "--shards=3",
+            "--batch-size=4",
+            "--strategy=hash",
+        )
+        self.assertIn("Primary key is not an integer. Using range instead of hash.", out)
+        self.assertIn("Re-screened 15 records", out)
+        self.assert_rescreened(UuidSubjectScreening)
+        self.assertEqual(
+            set(RescreenShard.objects.values_list("strategy", flat=True)), {RANGE}
+        )
+
+    def test_invalid_options_raise(self):
+        for args in [
+            ["--shards=0"],
+            ["--shards=-2"],
+            ["--batch-size=-1"],
+            ["--stale-after=x"],
+        ]:
+            with self.subTest(args=args):
+                self.assertRaises(
+                    CommandError, self.rescreen, "--model=tests.subjectscreening", *args
+                )
+        self.assertFalse(RescreenShard.objects.exists())
+
+    def test_status(self):
+        call_command("rescreen", "run1", "--model=tests.subjectscreening", stdout=StringIO())
+        out = StringIO()
+        call_command(
+            "rescreen", "run1", "--model=tests.subjectscreening", "--status", stdout=out
+        )
+        self.assertEqual(out.getvalue().count("done"), 4)
+        self.assertIn("run1 1/4", out.getvalue())
+
+    def test_status_shows_failed_records(self):
+        bad_pk = SubjectScreening.objects.order_by("pk")[0].pk
+        shard = ShardedRescreen("run1", model_cls=SubjectScreening).create_shards()[0]
+        RescreenShard.objects.filter(pk=shard.pk).update(errors=1, failed_pks=str(bad_pk))
+        out = self.rescreen("--model=tests.subjectscreening", "--status")
+        self.assertIn("run1 1/4: 0 processed, 1 errors", out)
+        self.assertIn(f"failed pks: {bad_pk}", out)
+
+    @override_settings(SUBJECT_SCREENING_MODEL=None)
+    def test_screening_model_required(self):
+        self.assertRaises(CommandError, call_command, "rescreen", "run1")
+
+    @override_settings(SUBJECT_SCREENING_MODEL="tests.subjectscreening")
+    def test_screening_model_from_settings(self):
+        out = StringIO()
+        call_command("rescreen", "run1", stdout=out)
+        self.assertIn("Re-screened 15 records", out.getvalue())
@@ -0,0 +1,284 @@
+import json
+import random
+import tempfile
+from pathlib import Path
+from unittest import skipUnless
+
+from django.test import TestCase
+from edc_constants.constants import FEMALE, MALE, NO, NOT_APPLICABLE, YES
+
+from intecomm_eligibility.eligibility import ScreeningEligibility
+from intecomm_eligibility.rules import (
+    RuleSet,
+    RuleSetError,
+    get_rules_path,
+    load_ruleset,
+)
+
+from .legacy_eligibility import LegacyScreeningEligibility
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+class CountingDict(dict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lookups = []
+
+    def get(self, key, default=None):
+        self.lookups.append(key)
+        return super().get(key, default)
+
+
+class RulesTests(TestCase):
+    basic_data = dict(
+        age_in_years=25,
+        consent_ability=YES,
+        excluded_by_bp_history=NO,
+        excluded_by_gluc_history=NO,
+        gender=MALE,
+        in_care_6m=YES,
+        lives_nearby=YES,
+        pregnant=NOT_APPLICABLE,
+        requires_acute_care=NO,
+        staying_nearby_6=YES,
+        unsuitable_for_study=NO,
+        unsuitable_agreed=NOT_APPLICABLE,
+    )
+
+    domains = dict(
+        age_in_years=[None, 15, 18, 25, 119, 120],
+        gender=[None, MALE, FEMALE],
+        pregnant=[None, YES, NO, NOT_APPLICABLE],
+        unsuitable_agreed=[None, YES, NO, NOT_APPLICABLE],
+        sys_blood_pressure_one=[None, -120, 120, 161, 200],
+        sys_blood_pressure_two=[None, 120, 161],
+        dia_blood_pressure_one=[None, -80, 80, 101, 130],
+        dia_blood_pressure_two=[None, 80, 101],
+    )
+
+    def get_records(self, count: int) -> list[dict]:
+        rnd = random.Random(7)
+        records = []
+        for _ in range(count):
+            record = {}
+            for fldattr in load_ruleset(get_rules_path()).fields:
+                if fldattr in self.basic_data and rnd.random() < 0.9:
+                    record[fldattr] = self.basic_data[fldattr]
+                else:
+                    record[fldattr] = rnd.choice(self.domains.get(fldattr, [None, YES, NO]))
+            record.update(consent_ability=rnd.choice([YES, YES, YES, NO, None]))
+            records.append(record)
+        return records
+
+    @staticmethod
+    def outcome(obj) -> tuple:
+        return obj.eligible, list(obj.reasons_ineligible.items())
+
+    def test_identical_to_legacy(self):
+        records = self.get_records(3000)
+        results = load_ruleset(get_rules_path()).evaluate_many(records)
+        for cleaned_data, result in zip(records, results):
+            legacy = LegacyScreeningEligibility(cleaned_data=cleaned_data)
+            eligibility = ScreeningEligibility(cleaned_data=cleaned_data)
+            self.assertEqual(self.outcome(legacy), self.outcome(eligibility), cleaned_data)
+            self.assertEqual(self.outcome(legacy), self.outcome(result), cleaned_data)
+            self.assertEqual(legacy.qualifying_conditions, eligibility.qualifying_conditions)
+        # the sample covers every outcome
+        reasons = set()
+        for result in results:
+            reasons.update(result.reasons_ineligible)
+        self.assertIn(YES, [result.eligible for result in results])
+        self.assertTrue(
+            {rule.reason for rule in load_ruleset(get_rules_path()).rules}.issubset(reasons)
+        )
+
+    def test_shared_expressions_evaluated_once(self):
+        ruleset = RuleSet(
+            dict(
+                fields=dict(hiv_dx=None, art_stable=None, art_adherent=None),
+                expressions=dict(hiv={"field": "hiv_dx", "eq": YES}),
+                rules=[
+                    dict(
+                        reason="art_stable",
+                        msg="ART unstable",
+                        when={"all": [{"ref": "hiv"}, {"field": "art_stable", "eq": NO}]},
+                    ),
+                    dict(
+                        reason="art_adherent",
+                        msg="ART not adherent",
+                        when={"all": [{"ref": "hiv"}, {"field": "art_adherent", "eq": NO}]},
+                    ),
+                ],
+            )
+        )
+        values = CountingDict(hiv_dx=YES, art_stable=NO, art_adherent=NO)
+        self.assertEqual(
+            ruleset.assess(values),
+            dict(art_stable="ART unstable", art_adherent="ART not adherent"),
+        )
+        self.assertEqual(values.lookups.count("hiv_dx"), 1)
+
+    def test_unless_orders_rules(self):
+        ruleset = RuleSet(
+            dict(
+                fields=dict(bp=None),
+                rules=[
+                    dict(
+                        reason="bp_high",
+                        msg="BP high",
+                        when={"field": "bp", "gt": 160},
+                        unless=["bp_not_done"],
+                    ),
+                    dict(
+                        reason="bp_not_done",
+                        msg="BP not done",
+                        when={"field": "bp", "missing": True},
+                    ),
+                ],
+            )
+        )
+        self.assertEqual(
+            [rule.reason for rule in ruleset.rules_in_order], ["bp_not_done", "bp_high"]
+        )
+        self.assertEqual(ruleset.assess(dict(bp=None)), dict(bp_not_done="BP not done"))
+        self.assertEqual(ruleset.assess(dict(bp=170)), dict(bp_high="BP high"))
+
+    def test_invalid_rules_raise(self):
+        for config in [
+            dict(fields=dict(age_in_years={"gt": 18, "msg": "age"})),
+            dict(fields=dict(age_in_years={"range": [18.5, 30], "msg": "age"})),
+            dict(fields=dict(age_in_years={"range": [18, "30"], "msg": "age"})),
+            dict(
+                fields=dict(hiv_dx=None),
+                rules=[dict(reason="a", msg="a", when={"field": "x"})],
+            ),
+            dict(
+                fields=dict(hiv_dx=None), rules=[dict(reason="a", msg="a", when={"ref": "x"})]
+            ),
+            dict(
+                fields=dict(hiv_dx=None),
+                rules=[
+                    dict(reason="a", msg="a", when={"field": "hiv_dx", "eq": YES, "ne": NO})
+                ],
+            ),
+            dict(
+                fields=dict(hiv_dx=None),
+                expressions=dict(x={"ref": "y"}, y={"not": {"ref": "x"}}),
+                rules=[dict(reason="a", msg="a", when={"ref": "x"})],
+            ),
+            dict(
+                fields=dict(hiv_dx=None),
+                rules=[
+                    dict(reason="a", msg="a", when={"field": "hiv_dx"}, unless=["b"]),
+                    dict(reason="b", msg="b", when={"field": "hiv_dx"}, unless=["a"]),
+                ],
+            ),
+            dict(fields=dict(hiv_dx=None), rules=[dict(reason="a", when={"field": "hiv_dx"})]),
+            dict(
+                fields=dict(a=None, b=None),
+                rules=[
+                    dict(reason="x", msg="x", when={"field": "a", "eq": YES}),
+                    dict(reason="x", msg="x", when={"field": "b", "eq": YES}),
+                ],
+            ),
+            dict(
+                fields=dict(a=None, b=None),
+                rules=[
+                    dict(
+                        reason="x",
+                        msg="x",
+                        when={"all": [{"field": "a", "eq": YES}], "field": "b", "eq": YES},
+                    )
+                ],
+            ),
+            dict(
+                fields=dict(a=None, b=None),
+                rules=[
+                    dict(
+                        reason="x",
+                        msg="x",
+                        when={
+                            "all": [{"field": "a", "eq": YES}],
+                            "any": [{"field": "b", "eq": YES}],
+                        },
+                    )
+                ],
+            ),
+            dict(
+                fields=dict(a=None),
+                rules=[dict(reason="x", msg="x", when={"all": {"field": "a", "eq": YES}})],
+            ),
+            dict(
+                fields=dict(a=None),
+                rules=[dict(reason="x", msg="x", when={"any": "a"})],
+            ),
+            dict(
+                fields=dict(a=None),
+                rules=[dict(reason="x", msg="x", when={"not": {"field": "a"}, "eq": YES})],
+            ),
+        ]:
+            with self.subTest(config=config):
+                self.assertRaises(RuleSetError, RuleSet, config)
+
+    def test_fields_without_constraints(self):
+        config = dict(
+            fields=dict(hiv_dx=None),
+            rules=[dict(reason="hiv", msg="HIV", when={"field": "hiv_dx", "eq": NO})],
+        )
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "rules.json"
+            path.write_text(json.dumps(config))
+
+            class MyScreeningEligibility(ScreeningEligibility):
+                rules_path = path
+
+            for cleaned_data in [dict(hiv_dx=YES), dict(hiv_dx=NO)]:
+                with self.subTest(cleaned_data=cleaned_data):
+                    self.assertEqual(
+                        self.outcome(MyScreeningEligibility(cleaned_data=cleaned_data)),
+                        self.outcome(load_ruleset(path).evaluate(cleaned_data)),
+                    )
+            self.assertEqual(load_ruleset(path).evaluate(dict(hiv_dx=YES)).eligible, YES)
+
+    def test_rules_path(self):
+        config = json.loads(get_rules_path().read_text())
+        for rule in config["rules"]:
+            if rule["reason"] == "bp_high":
+                rule["when"]["all"][2]["any"][0]["gt"] = 140
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "rules.json"
+            path.write_text(json.dumps(config))
+
+            class MyScreeningEligibility(ScreeningEligibility):
+                rules_path = path
+
+            cleaned_data = dict(
+                **self.basic_data,
+                htn_dx=YES,
+                htn_dx_6m=YES,
+                htn_complications=NO,
+                sys_blood_pressure_one=150,
+                sys_blood_pressure_two=150,
+                dia_blood_pressure_one=90,
+                dia_blood_pressure_two=90,
+            )
+            self.assertTrue(ScreeningEligibility(cleaned_data=cleaned_data).is_eligible)
+            eligibility = MyScreeningEligibility(cleaned_data=cleaned_data)
+            self.assertFalse(eligibility.is_eligible)
+            self.assertIn("bp_high", eligibility.reasons_ineligible)
+
+    @skipUnless(yaml, "PyYAML not installed")
+    def test_yaml_rules(self):
+        config = json.loads(get_rules_path().read_text())
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "rules.yaml"
+            path.write_text(yaml.safe_dump(config))
+            records = self.get_records(200)
+            self.assertEqual(
+                load_ruleset(path).evaluate_many(records),
+                load_ruleset(get_rules_path()).evaluate_many(records),
+            )
@@ -13,6 +13,7 @@ base_dir = Path(__file__).resolve().parent.parent
 
 DEFAULT_SETTINGS = dict(  # nosec B106
     BASE_DIR=Path(__file__).resolve().parent.parent,
+    GIT_DIR=Path(__file__).resolve().parent,
     SECRET_KEY="django-insecure",  # nosec B106
     DEBUG=True,
     SUBJECT_CONSENT_MODEL=None,
@@ -27,6 +28,7 @@ DEFAULT_SETTINGS = dict(  # nosec B106
         "django.contrib.messages",
         "django.contrib.staticfiles",
         "intecomm_eligibility.apps.AppConfig",
+        "intecomm_eligibility.tests",
     ],
     MIDDLEWARE=[
         "django.middleware.security.SecurityMiddleware",